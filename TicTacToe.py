@@ -1,14 +1,46 @@
-from copy import deepcopy
+from array import array
+from collections.abc import MutableMapping
+from functools import lru_cache
 from typing import Final, Literal, Optional
 
-Entry = Literal["X", "O", "·", "W"]
-Players = Literal["X", "O"]
-TIC: Final[Entry] = "X"
-TAC: Final[Entry] = "O"
-WIN_MARKER: Final[Entry] = "W"
-EMPTY: Final[Entry] = "·"
+try:
+    from numba import njit, types
+    from numba.typed import Dict
+
+    _table_type = types.DictType(types.int64, types.UniTuple(types.int64, 2))
+    # explicit signatures, so everything is compiled (or loaded from the
+    # cache) at import rather than halfway through the first search
+    CANONICAL_SIGNATURE = types.int64(types.int64, types.int64)
+    CLASSIFY_SIGNATURE = types.int64(types.int64, types.int64, types.int64)
+    NEGAMAX_SIGNATURE = types.int64(*[types.int64] * 5, _table_type)
+    SEARCH_SIGNATURE = types.int64(*[types.int64] * 3, _table_type)
+
+    def _new_table() -> "Table":
+        return Dict.empty(_table_type.key_type, _table_type.value_type)
+
+except ImportError:
+    # numba is optional, without it the search runs as plain python
+    CANONICAL_SIGNATURE = CLASSIFY_SIGNATURE = None
+    NEGAMAX_SIGNATURE = SEARCH_SIGNATURE = None
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+    def _new_table() -> "Table":
+        return {}
+
+
+Entry = Literal[0, 1, 2, 3]
+Players = Literal[1, 2]
+EMPTY: Final[Entry] = 0
+TIC: Final[Entry] = 1
+TAC: Final[Entry] = 2
+WIN_MARKER: Final[Entry] = 3
+# entry -> how it's printed
+ENTRY_CHARS: Final[str] = "·XOW"
 Point = tuple[int, int]
-Board = dict[tuple[int, int], Entry]
+# entries indexed by `y * SIZE + x`
+Board = array
 BOT_VS_BOT = True
 
 INT32_MIN: Final[int] = -2_147_483_648
@@ -17,155 +49,354 @@ LOSING: Final[int] = -1
 WINNING: Final[int] = +1
 SIZE: Final[int] = 3
 TIE = 0
+# neither won nor tied yet
+ONGOING: Final[int] = 2
+
+# bit `y * SIZE + x` of a mask is set when (x, y) is occupied
+FULL: Final[int] = 0o777
+# the order children are searched in, as cell indices. center, corners, then
+# edges, strongest first so that alpha-beta cuts off as early as possible
+MOVE_ORDER: Final[tuple[int, ...]] = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+# cell index -> point, the inverse of `y * SIZE + x`
+CELLS: Final[tuple[Point, ...]] = tuple(
+    (x, y) for y in range(SIZE) for x in range(SIZE)
+)
+LINES: Final[tuple[int, ...]] = (
+    # horizontal
+    0o007,
+    0o070,
+    0o700,
+    # vertical
+    0o111,
+    0o222,
+    0o444,
+    # diagonal
+    0o421,
+    # other diagonal
+    0o124,
+)
+
+
+def _bits_to_points(mask: int) -> list[Point]:
+    """
+    The points covered by the set bits of a mask
+    """
+    return [point for i, point in enumerate(CELLS) if mask >> i & 1]
+
+
+# line mask -> the points on it
+LINE_POINTS: Final[dict[int, tuple[Point, ...]]] = {
+    line: tuple(_bits_to_points(line)) for line in LINES
+}
+
+
+def _transform(k: int, x: int, y: int) -> Point:
+    """
+    Map a point through the k-th symmetry of the board,
+    the 4 rotations and their mirror images
+    """
+    for _ in range(k % 4):
+        # rotate by 90 degrees
+        x, y = SIZE - 1 - y, x
+    if k >= 4:
+        x = SIZE - 1 - x
+    return (x, y)
+
+
+# cell index -> cell index, for each symmetry
+PERMS: Final[tuple[tuple[int, ...], ...]] = tuple(
+    tuple(ty * SIZE + tx for tx, ty in (_transform(k, x, y) for x, y in CELLS))
+    for k in range(8)
+)
+
+
+@njit(CANONICAL_SIGNATURE, cache=True)
+def canonical(x_mask: int, o_mask: int) -> int:
+    """
+    A key shared by all 8 symmetric variants of a board,
+    the smallest of their `x_mask << SIZE * SIZE | o_mask`
+
+    The side to move is implied, TIC moves whenever the counts are equal
+    """
+    key = x_mask << SIZE * SIZE | o_mask
+    for k in range(1, 8):
+        perm = PERMS[k]
+        x_sym = 0
+        o_sym = 0
+        for i in range(SIZE * SIZE):
+            if x_mask >> i & 1:
+                x_sym |= 1 << perm[i]
+            elif o_mask >> i & 1:
+                o_sym |= 1 << perm[i]
+        key = min(key, x_sym << SIZE * SIZE | o_sym)
+    return key
+
+
+@njit(CLASSIFY_SIGNATURE, cache=True)
+def classify(x_mask: int, o_mask: int, turn: int) -> int:
+    """
+    Check if the side that just moved has won or the board is full, at once
+
+    Returns:
+        LOSING if the side that just moved has won,
+        TIE if the board is full otherwise,
+        and ONGOING if there are moves left
+    """
+    last = o_mask if turn == 0 else x_mask
+    for line in LINES:
+        if last & line == line:
+            return LOSING
+    if x_mask | o_mask == FULL:
+        return TIE
+    return ONGOING
+
+
+# transposition table entry flags
+EXACT: Final[int] = 0
+LOWER_BOUND: Final[int] = 1
+UPPER_BOUND: Final[int] = 2
+# canonical key -> (negamax value, flag)
+#
+# a numba typed Dict when numba is installed, so the jitted search can use
+# it, and a plain dict otherwise
+Table = MutableMapping[int, tuple[int, int]]
+TT: Table = _new_table()
+
+
+@njit(NEGAMAX_SIGNATURE, cache=True)
+def negamax(
+    x_mask: int, o_mask: int, turn: int, alpha: int, beta: int, tt: Table
+) -> int:
+    """
+    Calculate the negamax value of a board with alpha-beta pruning
+
+    Params:
+        x_mask, o_mask: the cells taken by TIC and TAC
+        turn: the piece to move, 0 for TIC and 1 for TAC
+        alpha: the score the side to move is already assured of
+        beta: the score the side that just moved is already assured of,
+        negated. i.e. anything at or above it will never be allowed
+        tt: the transposition table, see `TT`
+
+    Returns:
+        the score of the current board, relative to the side to move
+
+    A board is not expanded further when either the game is won or tied,
+    or when the window closes (alpha >= beta)
+
+    Results are memoized in `tt` by their `canonical` key, so symmetric
+    boards share an entry, along with whether they are exact
+    or only a bound because of a cutoff
+
+    The depth first search runs on an explicit stack rather than recursing,
+    to save a python call per board. A frame is
+    (x_mask, o_mask, turn, alpha, beta, alpha_orig, key, value, nth),
+    where `nth` is the position in `MOVE_ORDER` of the child being searched,
+    or -1 if the board hasn't been looked at yet
+    """
+    stack = [(x_mask, o_mask, turn, alpha, beta, alpha, -1, INT32_MIN, -1)]
+    # the score of the last finished board, relative to its side to move
+    result = 0
+    while stack:
+        x_mask, o_mask, turn, alpha, beta, alpha_orig, key, value, nth = stack.pop()
+        if nth < 0:
+            key = canonical(x_mask, o_mask)
+            if key in tt:
+                stored, flag = tt[key]
+                if flag == EXACT:
+                    result = stored
+                    continue
+                elif flag == LOWER_BOUND:
+                    alpha = max(alpha, stored)
+                else:
+                    beta = min(beta, stored)
+                if alpha >= beta:
+                    result = stored
+                    continue
+            status = classify(x_mask, o_mask, turn)
+            if status != ONGOING:
+                tt[key] = (status, EXACT)
+                result = status
+                continue
+            nth = 0
+        else:
+            # the child's score is from the other side's perspective
+            value = max(value, -result)
+            alpha = max(alpha, value)
+            nth = SIZE * SIZE if alpha >= beta else nth + 1
+        taken = x_mask | o_mask
+        while nth < SIZE * SIZE and taken & (1 << MOVE_ORDER[nth]):
+            nth += 1
+        if nth < SIZE * SIZE:
+            # come back to this board once the child is done
+            stack.append(
+                (x_mask, o_mask, turn, alpha, beta, alpha_orig, key, value, nth)
+            )
+            bit = 1 << MOVE_ORDER[nth]
+            if turn == 0:
+                x_child, o_child = x_mask | bit, o_mask
+            else:
+                x_child, o_child = x_mask, o_mask | bit
+            stack.append(
+                (x_child, o_child, 1 - turn, -beta, -alpha, -beta, -1, INT32_MIN, -1)
+            )
+            continue
+        if value <= alpha_orig:
+            tt[key] = (value, UPPER_BOUND)
+        elif value >= beta:
+            tt[key] = (value, LOWER_BOUND)
+        else:
+            tt[key] = (value, EXACT)
+        result = value
+    return result
+
+
+@njit(SEARCH_SIGNATURE, cache=True)
+def search(x_mask: int, o_mask: int, turn: int, tt: Table) -> int:
+    """
+    The best cell to move to, as `y * SIZE + x`, or -1 if there is none
+    """
+    if classify(x_mask, o_mask, turn) != ONGOING:
+        # the game is already over
+        return -1
+    best = -1
+    best_value = INT32_MIN
+    alpha = LOSING
+    taken = x_mask | o_mask
+    for i in MOVE_ORDER:
+        bit = 1 << i
+        if taken & bit:
+            continue
+        if turn == 0:
+            x_child, o_child = x_mask | bit, o_mask
+        else:
+            x_child, o_child = x_mask, o_mask | bit
+        value = -negamax(x_child, o_child, 1 - turn, -WINNING, -alpha, tt)
+        if value > best_value:
+            best = i
+            best_value = value
+            alpha = max(alpha, value)
+            if value == WINNING:
+                break
+    return best
+
+
+# (x_mask, o_mask) -> best cell, for every board with at most one stone.
+# TIC always opens, so these are the empty board and the 9 single X's
+OPENING: Final[dict[tuple[int, int], int]] = {
+    (x_mask, 0): search(x_mask, 0, 0 if x_mask == 0 else 1, TT)
+    for x_mask in [0] + [1 << i for i in range(SIZE * SIZE)]
+}
+
+
+@lru_cache(maxsize=None)
+def _cached_search(x_mask: int, o_mask: int, turn: int) -> int:
+    """
+    `search` on the global `TT`, memoized for the lifetime of the process
+    so a board seen again (e.g. in another game) costs a single lookup
+    """
+    return search(x_mask, o_mask, turn, TT)
 
 
 class GameState:
-    player: Players = TIC
-    opponent: Players = TAC
+    __slots__ = ("player", "opponent", "x_mask", "o_mask")
+    player: Players
+    opponent: Players
     size: Final[int] = SIZE
-    fields: Board = {}
+    x_mask: int
+    o_mask: int
+
+    def __init__(self):
+        self.player = TIC
+        self.opponent = TAC
+        self.x_mask = 0
+        self.o_mask = 0
 
-    def __init__(self, other=None):
-        if other:
-            self.__dict__ = deepcopy(other.__dict__)
-            return
-        self.fields = {}
-        for y in range(self.size):
-            for x in range(self.size):
-                self.fields[x, y] = EMPTY
+    def clone(self) -> "GameState":
+        """
+        Returns a copy of the board
+        """
+        board = GameState.__new__(GameState)
+        board.player = self.player
+        board.opponent = self.opponent
+        board.x_mask = self.x_mask
+        board.o_mask = self.o_mask
+        return board
 
     def move(self, x: int, y: int):
         """
         Returns a new board with the move executed
         """
-        assert x < self.size and y < self.size, "Invalid move ({}, {})".format(x, y)
         assert (
-            self.fields[x, y] == EMPTY
+            0 <= x < self.size and 0 <= y < self.size
+        ), "Invalid move ({}, {})".format(x, y)
+        bit = 1 << (y * self.size + x)
+        assert not (
+            (self.x_mask | self.o_mask) & bit
         ), "Invalid non empty move ({}, {}), occupied by {}".format(
-            x, y, self.fields[x, y]
+            x, y, ENTRY_CHARS[self.fields[y * self.size + x]]
         )
-        board = GameState(self)
-        board.fields[x, y] = board.player
-        (board.player, board.opponent) = (board.opponent, board.player)
+        board = self.clone()
+        if self.player == TIC:
+            board.x_mask |= bit
+        else:
+            board.o_mask |= bit
+        (board.player, board.opponent) = (self.opponent, self.player)
         return board
 
-    def min_max(self, is_opponent_move: bool) -> tuple[int, Optional[Point]]:
-        """
-        Calculate the minimax value of a board
-
-        Params:
-            is_opponent_move: if it's the opponent's move.
-            i.e. whether to maximize or minimize the value
-
-        Returns:
-            the score of the current board
-            and the move that leads to such score
-
-        Recursion stop when either the game is won or tied
-
-        WINING and LOSING and `opponent` are relative to the bot/algorithms perspective.
-        """
-        won, _ = self.won()
-        if won:
-            if is_opponent_move:
-                return (LOSING, None)
-            return (WINNING, None)
-        elif GameState.no_empty(self.fields):
-            return (TIE, None)
-        elif is_opponent_move:
-            best = (INT32_MIN, None)
-            for x, y in self.fields:
-                if self.fields[x, y] == EMPTY:
-                    # Depth first search, essentially
-                    #
-                    # the next move is bot's move, should maximize its value
-                    value, _ = self.move(x, y).min_max(False)
-                    if value > best[0]:
-                        best = (value, (x, y))
-                        if value == WINNING:
-                            break
-            return best
-        else:
-            best = (INT32_MAX, None)
-            for x, y in self.fields:
-                if self.fields[x, y] == EMPTY:
-                    value, _ = self.move(x, y).min_max(True)
-                    if value < best[0]:
-                        best = (value, (x, y))
-                        if value == LOSING:
-                            break
-            return best
-
-    def best(self):
+    def best(self) -> Optional[Point]:
         """
         The best move
         """
-        return self.min_max(True)[1]
+        i = OPENING.get((self.x_mask, self.o_mask))
+        if i is None:
+            turn = 0 if self.player == TIC else 1
+            i = _cached_search(self.x_mask, self.o_mask, turn)
+        if i < 0:
+            return None
+        return CELLS[i]
 
-    @staticmethod
-    def no_empty(fields: Board) -> bool:
+    def no_empty(self) -> bool:
         """
         Check if there are no empty fields left
         """
-        for x, y in fields:
-            if fields[x, y] == EMPTY:
-                return False
-        return True
+        return (self.x_mask | self.o_mask) == FULL
 
     def won(self) -> tuple[bool, list[Point]]:
         """
         Check if the *opponent* has won
         """
-        # horizontal
-        for y in range(self.size):
-            winning = []
-            for x in range(self.size):
-                if self.fields[x, y] == self.opponent:
-                    winning.append((x, y))
-            if len(winning) == self.size:
-                return True, winning
-        # vertical
-        for x in range(self.size):
-            winning = []
-            for y in range(self.size):
-                if self.fields[x, y] == self.opponent:
-                    winning.append((x, y))
-            if len(winning) == self.size:
-                return True, winning
-        # diagonal
-        winning = []
-        for y in range(self.size):
-            x = y
-            if self.fields[x, y] == self.opponent:
-                winning.append((x, y))
-        if len(winning) == self.size:
-            return True, winning
-        # other diagonal
-        winning = []
-        for y in range(self.size):
-            x = self.size - 1 - y
-            if self.fields[x, y] == self.opponent:
-                winning.append((x, y))
-        if len(winning) == self.size:
-            return True, winning
+        mask = self.x_mask if self.opponent == TIC else self.o_mask
+        for line in LINES:
+            if mask & line == line:
+                return True, list(LINE_POINTS[line])
         # default
         return False, []
 
+    @property
+    def fields(self) -> Board:
+        """
+        The board as a flat array of entries, e.g. for printing
+        """
+        fields: Board = array("b", [EMPTY] * (SIZE * SIZE))
+        for i in range(SIZE * SIZE):
+            if self.x_mask >> i & 1:
+                fields[i] = TIC
+            elif self.o_mask >> i & 1:
+                fields[i] = TAC
+        return fields
+
     @staticmethod
     def board_stringify(fields: Board) -> str:
-        string = ""
-        for y in range(SIZE):
-            for x in range(SIZE):
-                string += fields[x, y]
-            if y != SIZE - 1:
-                string += "\n"
-        return string
+        return "\n".join(
+            "".join(ENTRY_CHARS[fields[y * SIZE + x]] for x in range(SIZE))
+            for y in range(SIZE)
+        )
 
     def __str__(self) -> str:
-        string = ""
-        string += "next: {}\n".format(self.player)
-        string += GameState.board_stringify(self.fields)
-        return string
+        return "next: {}\n{}".format(
+            ENTRY_CHARS[self.player], GameState.board_stringify(self.fields)
+        )
 
 
 def main():
@@ -175,16 +406,16 @@ def main():
     last = GameState()
 
     def check_win(current_username: str):
-        if GameState.no_empty(last.fields):
+        if last.no_empty():
             print("Tie!")
             return True
         won, winning = last.won()
         if won:
             print(f"{current_username} lost!")
             print("\n=== Winning move ===")
-            d = deepcopy(last.fields)
+            d = last.fields
             for x, y in winning:
-                d[x, y] = WIN_MARKER
+                d[y * SIZE + x] = WIN_MARKER
             print(GameState.board_stringify(d))
             return True
         return False